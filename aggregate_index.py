@@ -0,0 +1,147 @@
+"""
+Aggregate index: a small precomputed cube over low-cardinality dimensions.
+
+At load time the sheet is grouped once by the factorized codes of its low-cardinality
+columns (e.g. Region, Product, Sales_Rep, month of Date), keeping partial sums, counts,
+mins and maxes per measure. sum/count/mean/min/max aggregations and pivots over those
+dimensions are then rolled up from the cube, whose size depends on the number of
+dimension combinations rather than the number of rows. Anything else falls back to the
+full scan in excel_tools.
+"""
+import logging
+import weakref
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_AGGS = ('sum', 'count', 'mean', 'min', 'max')
+PARTIALS = ('sum', 'count', 'min', 'max')
+MONTH_SUFFIX = '_month'  # Derived dimension name for the month of a date column
+
+class AggregateIndex:
+    """Precomputed partial aggregates per combination of dimension values."""
+
+    def __init__(self, cube: pd.DataFrame, uniques: Dict[str, pd.Index], measures: List[str],
+                 source: pd.DataFrame):
+        self.cube = cube
+        self.uniques = uniques
+        self.dimensions = list(uniques)
+        self.measures = measures
+        self._source = weakref.ref(source)
+        self._source_shape = source.shape
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, dimensions: Optional[List[str]] = None,
+              measures: Optional[List[str]] = None, max_cardinality: int = 50,
+              max_cells: int = 200_000) -> 'AggregateIndex':
+        """
+        Build the cube. By default dimensions are text/category columns with at most
+        `max_cardinality` distinct values plus the month of each date column, added
+        lowest-cardinality first while the cube stays under `max_cells` combinations.
+        Measures default to every other numeric column.
+        """
+        keys = {}
+        if dimensions is None:
+            candidates = {}
+            for column in df.columns:
+                series = df[column]
+                if pd.api.types.is_datetime64_any_dtype(series):
+                    candidates[f"{column}{MONTH_SUFFIX}"] = series.dt.to_period('M')
+                elif not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+                    candidates[column] = series
+            cells = 1
+            for name, series in sorted(candidates.items(), key=lambda item: item[1].nunique()):
+                cardinality = series.nunique()
+                if cardinality < 2 or cardinality > max_cardinality or cells * cardinality > max_cells:
+                    continue
+                keys[name] = series
+                cells *= cardinality
+        else:
+            for name in dimensions:
+                if name not in df.columns and name.endswith(MONTH_SUFFIX):
+                    keys[name] = df[name[:-len(MONTH_SUFFIX)]].dt.to_period('M')
+                else:
+                    keys[name] = df[name]
+        if not keys:
+            raise ValueError("No low-cardinality dimensions to index")
+
+        if measures is None:
+            measures = [
+                column for column in df.columns
+                if column not in keys
+                and pd.api.types.is_numeric_dtype(df[column])
+                and not pd.api.types.is_bool_dtype(df[column])
+            ]
+
+        # Factorize once; -1 marks missing keys and is kept so rollups over other
+        # dimensions still include those rows
+        codes, uniques = {}, {}
+        for name, series in keys.items():
+            codes[name], uniques[name] = pd.factorize(series, sort=True)
+        frame = pd.DataFrame(codes, index=df.index)
+        for measure in measures:
+            frame[measure] = df[measure]
+        cube = frame.groupby(list(codes), sort=True).agg(
+            **{f"{measure}__{partial}": (measure, partial) for measure in measures for partial in PARTIALS}
+        ).reset_index()
+
+        logger.info(f"Built aggregate index: {len(cube)} cells over {list(codes)} for {len(df)} rows")
+        return cls(cube, uniques, list(measures), df)
+
+    def covers(self, df: pd.DataFrame) -> bool:
+        """True if the index was built from this exact frame."""
+        return self._source() is df and df.shape == self._source_shape
+
+    def can_answer(self, group_by: List[str], metrics: Dict[str, str]) -> bool:
+        return (
+            bool(group_by)
+            and len(set(group_by)) == len(group_by)
+            and all(dim in self.uniques for dim in group_by)
+            and all(
+                column in self.measures and isinstance(func, str) and func in SUPPORTED_AGGS
+                for column, func in metrics.items()
+            )
+        )
+
+    def aggregate(self, group_by: List[str], metrics: Dict[str, str]) -> pd.DataFrame:
+        """Same result as df.groupby(group_by).agg(metrics).reset_index(), from the cube."""
+        if not self.can_answer(group_by, metrics):
+            raise ValueError(f"Aggregate index can't answer group_by={group_by}, metrics={metrics}")
+        cube = self.cube
+        # Groups with a missing key are dropped, as groupby does by default
+        present = np.logical_and.reduce([cube[dim].to_numpy() >= 0 for dim in group_by])
+        grouped = cube[present].groupby(group_by, sort=True)
+
+        # Only roll up the partials the requested functions need
+        needed = {'sum': [], 'min': [], 'max': []}
+        for measure, func in metrics.items():
+            for partial in (('sum', 'count') if func == 'mean' else (func,)):
+                needed['sum' if partial == 'count' else partial].append(f"{measure}__{partial}")
+        rolled = pd.concat(
+            [getattr(grouped[columns], combine)() for combine, columns in needed.items() if columns],
+            axis=1,
+        )
+
+        result = pd.DataFrame({
+            dim: self.uniques[dim].take(rolled.index.get_level_values(dim).to_numpy())
+            for dim in group_by
+        })
+        for measure, func in metrics.items():
+            if func == 'mean':
+                values = rolled[f"{measure}__sum"] / rolled[f"{measure}__count"].replace(0, np.nan)
+            else:
+                values = rolled[f"{measure}__{func}"]
+            result[measure] = values.to_numpy()
+        return result
+
+    def pivot(self, index: List[str], columns: List[str], values: List[str], aggfunc: str = 'sum') -> pd.DataFrame:
+        """Same result as excel_tools.pivot_table, pivoting the rolled-up cube instead of the rows."""
+        keys = list(index) + list(columns)
+        rolled = self.aggregate(keys, {value: aggfunc for value in values})
+        # One row per cell after rollup, so applying the same function again just places the
+        # values; counts are already computed and only need summing
+        pivot = pd.pivot_table(rolled, index=index, columns=columns, values=values,
+                               aggfunc='sum' if aggfunc == 'count' else aggfunc, fill_value=0)
+        return pivot.reset_index()
@@ -1,146 +1,16 @@
 import streamlit as st
 import pandas as pd
-import openpyxl
 from io import BytesIO
 import io  # Add this import at the top with others if not present
 
 from typing import Dict, List, Any, Optional
 import logging
+from excel_processor import ExcelProcessor, log_event
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class ExcelProcessor:
-    """Memory-efficient Excel file processor with multi-sheet support"""
-    
-    def __init__(self):
-        self.workbook = None
-        self.sheet_names = []
-        self.current_sheet = None
-        self.chunk_size = 1000  # Process 1000 rows at a time
-    
-    def load_excel_file(self, uploaded_file) -> bool:
-        """Load Excel file and extract sheet information"""
-        try:
-            # Read the uploaded file into BytesIO
-            file_bytes = BytesIO(uploaded_file.read())
-            
-            # Load workbook with openpyxl for sheet info
-            self.workbook = openpyxl.load_workbook(file_bytes, read_only=True)
-            self.sheet_names = self.workbook.sheetnames
-            
-            # Reset file pointer for pandas
-            file_bytes.seek(0)
-            self.file_bytes = file_bytes
-            
-            logger.info(f"Successfully loaded Excel file with {len(self.sheet_names)} sheets")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error loading Excel file: {str(e)}")
-            st.error(f"Error loading Excel file: {str(e)}")
-            return False
-    
-    def get_sheet_info(self) -> Dict[str, Any]:
-        """Get information about all sheets in the workbook"""
-        sheet_info = {}
-        
-        for sheet_name in self.sheet_names:
-            try:
-                sheet = self.workbook[sheet_name]
-                sheet_info[sheet_name] = {
-    'max_row': sheet.max_row,
-    'max_column': sheet.max_column,
-    # 'dimensions': sheet.dimensions,  # Removed unsupported attribute
-    'range': f"A1:{openpyxl.utils.get_column_letter(sheet.max_column)}{sheet.max_row}" if sheet.max_row and sheet.max_column else 'Unknown'
-}
-            except Exception as e:
-                logger.warning(f"Could not get info for sheet {sheet_name}: {str(e)}")
-                sheet_info[sheet_name] = {'error': str(e)}
-        
-        return sheet_info
-    
-    def read_sheet_chunked(self, sheet_name: str, chunk_size: Optional[int] = None) -> pd.DataFrame:
-        """Read a specific sheet with chunking for memory efficiency"""
-        if chunk_size is None:
-            chunk_size = self.chunk_size
-        
-        try:
-            # Reset file pointer
-            self.file_bytes.seek(0)
-            
-            # Read the specific sheet
-            df = pd.read_excel(
-                self.file_bytes,
-                sheet_name=sheet_name,
-                engine='openpyxl'
-            )
-            
-            # Detect and convert data types
-            df = self._detect_and_convert_types(df)
-            
-            logger.info(f"Successfully read sheet '{sheet_name}' with {len(df)} rows and {len(df.columns)} columns")
-            return df
-            
-        except Exception as e:
-            logger.error(f"Error reading sheet {sheet_name}: {str(e)}")
-            st.error(f"Error reading sheet {sheet_name}: {str(e)}")
-            return pd.DataFrame()
-    
-    def _detect_and_convert_types(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Detect and convert data types for better performance"""
-        for column in df.columns:
-            try:
-                # Try to convert to numeric
-                if df[column].dtype == 'object':
-                    # Check if it's a date
-                    if self._is_date_column(df[column]):
-                        df[column] = pd.to_datetime(df[column], errors='coerce')
-                    else:
-                        # Try numeric conversion
-                        numeric_series = pd.to_numeric(df[column], errors='coerce')
-                        if not numeric_series.isna().all():
-                            df[column] = numeric_series
-            except Exception as e:
-                logger.warning(f"Could not convert column {column}: {str(e)}")
-                continue
-        
-        return df
-    
-    def _is_date_column(self, series: pd.Series) -> bool:
-        """Check if a series contains date-like values"""
-        sample_size = min(100, len(series))
-        sample = series.dropna().head(sample_size)
-        
-        if len(sample) == 0:
-            return False
-        
-        date_count = 0
-        for value in sample:
-            try:
-                pd.to_datetime(value)
-                date_count += 1
-            except:
-                continue
-        
-        # If more than 50% of samples are dates, consider it a date column
-        return (date_count / len(sample)) > 0.5
-    
-    def get_column_info(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """Get detailed information about columns"""
-        column_info = {}
-        
-        for column in df.columns:
-            column_info[column] = {
-                'dtype': str(df[column].dtype),
-                'null_count': df[column].isnull().sum(),
-                'unique_count': df[column].nunique(),
-                'sample_values': df[column].dropna().head(5).tolist()
-            }
-        
-        return column_info
-
 def main():
     st.set_page_config(
         page_title="Excel Sheets Agent",
@@ -153,7 +23,7 @@ def main():
     
     # Initialize session state
     if 'processor' not in st.session_state:
-        st.session_state.processor = ExcelProcessor()
+        st.session_state.processor = ExcelProcessor(on_error=st.error)
     if 'current_df' not in st.session_state:
         st.session_state.current_df = None
     if 'sheet_info' not in st.session_state:
@@ -265,15 +135,10 @@ def main():
 
 import sys
 import traceback
-from llm_utils import run_gemini_query
 
 import time
 from functools import lru_cache
 
-def log_event(event: str, **kwargs):
-    with open("app_metrics.log", "a") as f:
-        f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} | {event} | {kwargs}\n")
-
 @st.cache_data(show_spinner=False)
 def cached_safe_exec(code: str, df: pd.DataFrame) -> Optional[pd.DataFrame]:
     """Cacheable version of safe_exec for identical queries and data."""
@@ -297,13 +162,38 @@ def safe_exec(code: str, df: pd.DataFrame) -> Optional[pd.DataFrame]:
         st.info(f"Query executed in {elapsed:.2f} seconds")
     return result
 
+def run_query_plan(plan, df: pd.DataFrame, show_timing: bool = True) -> Optional[pd.DataFrame]:
+    """Execute a query plan against the current sheet, reusing cached parent results, and log timing."""
+    from query_plan import execute_plan
+    start = time.time()
+    try:
+        result = execute_plan(plan, df, st.session_state.plan_cache)
+    except Exception as e:
+        log_event("safe_exec_error", error=str(e), plan=plan.describe())
+        result = None
+    elapsed = time.time() - start
+    log_event("query_exec", plan=plan.describe(), elapsed=elapsed)
+    if not show_timing:
+        return result
+    if elapsed > 10:
+        st.warning(f"⚠️ Query took {elapsed:.2f} seconds (exceeds 10s target)")
+    else:
+        st.info(f"Query executed in {elapsed:.2f} seconds")
+    return result
+
+@st.cache_data(show_spinner=False)
+def cached_schema_summaries(df: pd.DataFrame) -> Dict[str, str]:
+    """Per-column schema summaries, computed once per loaded sheet."""
+    from schema_context import summarize_schema
+    return summarize_schema(df)
+
 def phase2_nl_query_ui():
     st.header("🤖 Natural Language Query")
     if st.session_state.current_df is None:
         st.info("Please load a sheet first.")
         return
     df = st.session_state.current_df
-    columns = list(df.columns)
+    last_plan = st.session_state.get('last_plan')
     with st.form("nl_query_form"):
         nl_query = st.text_input("Enter your query (e.g., 'Show customers from Delhi with > 10000 revenue')")
         query_type = st.selectbox(
@@ -311,16 +201,49 @@ def phase2_nl_query_ui():
             ["filter", "aggregate", "sort", "pivot"],
             help="What kind of operation do you want to perform?"
         )
+        refine = st.checkbox(
+            "Refine previous result",
+            disabled=last_plan is None,
+            help="Apply this query to the previous result (e.g. 'now only North region') instead of the full sheet"
+        )
         submitted = st.form_submit_button("Run Query")
     if submitted and nl_query:
+        # Imported on first query so sessions that only preview data never load the LLM stack
+        from llm_utils import run_gemini_query
+        from query_plan import QueryPlan
+        from schema_context import build_schema_context
         with st.spinner("Calling Gemini LLM and executing query..."):
-            code = run_gemini_query(query_type, nl_query, columns)
+            base_plan = last_plan if refine and last_plan is not None else QueryPlan(st.session_state.current_sheet)
+            # Rebuilding the parent is usually a cache hit; only the new query's timing is shown
+            base_df = run_query_plan(base_plan, df, show_timing=False) if base_plan.steps else df
+            if base_df is None:
+                st.error("Could not rebuild the previous result. Run the query without refining.")
+                return
+            schema = build_schema_context(base_df, nl_query, summaries=cached_schema_summaries(base_df))
+            usage = {}
+            code = run_gemini_query(query_type, nl_query, schema.text, usage=usage)
+            log_event(
+                "llm_request",
+                query_type=query_type,
+                schema_tokens=schema.token_count,
+                schema_columns=len(schema.columns),
+                omitted_columns=len(schema.omitted),
+                **usage,
+            )
             if code:
                 st.code(code, language="python")
-                result_df = safe_exec(code, df)
+                plan = base_plan.expr(code)
+                result_df = run_query_plan(plan, df)
                 if result_df is not None:
+                    # Only tables can be refined; scalar answers end the chain
+                    is_table = isinstance(result_df, pd.DataFrame)
+                    st.session_state.last_plan = plan if is_table else None
                     st.success("Query executed!")
-                    st.dataframe(result_df.head(100), use_container_width=True)
+                    st.caption(f"Plan: {plan.describe()}")
+                    if is_table:
+                        st.dataframe(result_df.head(100), use_container_width=True)
+                    else:
+                        st.write(result_df)
             else:
                 st.error("Gemini LLM could not generate a valid pandas expression. Try rewording your query.")
 
@@ -334,11 +257,16 @@ def main():
     st.markdown("Upload and analyze Excel files with natural language queries")
     # Initialize session state
     if 'processor' not in st.session_state:
-        st.session_state.processor = ExcelProcessor()
+        st.session_state.processor = ExcelProcessor(on_error=st.error)
     if 'current_df' not in st.session_state:
         st.session_state.current_df = None
     if 'sheet_info' not in st.session_state:
         st.session_state.sheet_info = {}
+    if 'plan_cache' not in st.session_state:
+        from query_plan import PlanCache
+        st.session_state.plan_cache = PlanCache()
+    if 'last_plan' not in st.session_state:
+        st.session_state.last_plan = None
     # Sidebar for file upload and sheet selection
     with st.sidebar:
         st.header("📁 File Upload")
@@ -367,6 +295,9 @@ def main():
                     if not df.empty:
                         st.session_state.current_df = df
                         st.session_state.current_sheet = selected_sheet
+                        # Cached plan results belong to the previous sheet
+                        st.session_state.plan_cache.clear()
+                        st.session_state.last_plan = None
                         st.success(f"Sheet '{selected_sheet}' loaded successfully!")
                         st.rerun()
     # Main content area
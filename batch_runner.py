@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Headless batch query runner for the Excel Sheets Agent
+
+Runs many natural language queries (or explicit query plans) against a workbook through the
+same pipeline as the Streamlit app: ExcelProcessor -> schema context / column mapping ->
+Gemini LLM -> query plan execution. LLM calls and plan execution run in parallel pools, each
+sheet is loaded once, and results are streamed to the output directory as they complete.
+
+Queries file: JSON lines, one query per line, e.g.
+    {"id": "north_sales", "sheet": "Sales_Data", "type": "filter", "query": "sales in North region"}
+    {"sheet": "Sales_Data", "plan": [{"op": "aggregate", "group_by": ["Region"], "metrics": {"Total_Amount": "sum"}}]}
+or plain text with one NL query per line (uses --sheet and --type).
+
+Usage:
+    python batch_runner.py sample_data.xlsx queries.jsonl --out batch_results --llm-workers 8 --exec-workers 4
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+STAGES = ('load', 'schema', 'llm', 'exec', 'write')
+
+def result_file_name(query_id: str) -> str:
+    """File-system safe name for a query id, so ids like '../x' stay inside the output directory"""
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', query_id).lstrip('.')
+    return f"{name or 'query'}.csv"
+
+@dataclass
+class BatchQuery:
+    id: str
+    sheet: str
+    query: Optional[str] = None
+    query_type: str = 'filter'
+    plan_steps: Optional[List[Dict[str, Any]]] = None
+    code: Optional[str] = None
+    status: str = 'pending'
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+def read_queries(path: str, default_sheet: Optional[str], default_type: str) -> List[BatchQuery]:
+    """Parse a JSON lines or plain text queries file"""
+    queries, file_names = [], {}
+    with open(path, encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    for number, line in enumerate(lines, start=1):
+        if line.startswith('{'):
+            spec = json.loads(line)
+        else:
+            spec = {'query': line}
+        sheet = spec.get('sheet', default_sheet)
+        if not sheet:
+            raise ValueError(f"Query {number} has no sheet; add a 'sheet' field or pass --sheet")
+        if not spec.get('query') and not spec.get('plan'):
+            raise ValueError(f"Query {number} needs a 'query' or a 'plan'")
+        query_id = str(spec.get('id', f"q{number:04d}"))
+        file_name = result_file_name(query_id)
+        if file_name in file_names:
+            other = file_names[file_name]
+            if other == query_id:
+                raise ValueError(f"Query {number} reuses id '{query_id}'; ids must be unique")
+            raise ValueError(f"Query ids '{other}' and '{query_id}' both map to {file_name}; rename one")
+        file_names[file_name] = query_id
+        queries.append(BatchQuery(
+            id=query_id,
+            sheet=sheet,
+            query=spec.get('query'),
+            query_type=spec.get('type', default_type),
+            plan_steps=spec.get('plan'),
+        ))
+    return queries
+
+def load_sheets(workbook: str, sheet_names: List[str]) -> Tuple[Dict[str, pd.DataFrame], Dict[str, float]]:
+    """Open the workbook once and load each distinct sheet exactly once through ExcelProcessor"""
+    from excel_processor import ExcelProcessor
+
+    processor = ExcelProcessor(on_error=lambda message: print(f"❌ {message}", file=sys.stderr))
+    with open(workbook, 'rb') as f:
+        # ExcelProcessor expects an upload-like object with .read() and .name
+        upload = BytesIO(f.read())
+    upload.name = os.path.basename(workbook)
+    if not processor.load_excel_file(upload):
+        raise RuntimeError(f"Could not open workbook '{workbook}'")
+
+    sheets, load_times = {}, {}
+    for sheet_name in sheet_names:
+        if sheet_name not in processor.sheet_names:
+            raise ValueError(f"Sheet '{sheet_name}' not found (available: {processor.sheet_names})")
+        start = time.perf_counter()
+        df = processor.read_sheet_chunked(sheet_name)
+        load_times[sheet_name] = time.perf_counter() - start
+        if df.empty:
+            raise RuntimeError(f"Could not read sheet '{sheet_name}'")
+        sheets[sheet_name] = df
+    return sheets, load_times
+
+def generate_code(item: BatchQuery, df: pd.DataFrame, summaries: Dict[str, str]) -> BatchQuery:
+    """Schema context + LLM stage (runs in the LLM pool)"""
+    from llm_utils import run_gemini_query
+    from schema_context import build_schema_context
+
+    start = time.perf_counter()
+    schema = build_schema_context(df, item.query, summaries=summaries)
+    item.timings['schema'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    item.code = run_gemini_query(item.query_type, item.query, schema.text)
+    item.timings['llm'] = time.perf_counter() - start
+    if not item.code:
+        item.status = 'llm_failed'
+        item.error = "LLM could not generate a valid pandas expression"
+    return item
+
+def execute(item: BatchQuery, df: pd.DataFrame, cache, agg_index=None, date_index=None) -> Any:
+    """Plan execution stage (runs in the execution pool)"""
+    from query_plan import QueryPlan, execute_plan
+
+    if item.plan_steps is not None:
+        plan = QueryPlan.from_steps(item.sheet, item.plan_steps)
+    else:
+        plan = QueryPlan(item.sheet).expr(item.code)
+    start = time.perf_counter()
+    try:
+        return execute_plan(plan, df, cache, agg_index=agg_index, date_index=date_index)
+    finally:
+        item.timings['exec'] = time.perf_counter() - start
+
+def has_labeled_index(result: Any) -> bool:
+    """True when the index carries data (group keys, pivot rows, describe() stats) rather than row numbers"""
+    index = result.index
+    if isinstance(index, pd.MultiIndex) or index.name is not None:
+        return True
+    # RangeIndex or the sheet's row numbers after a filter/sort
+    return not pd.api.types.is_integer_dtype(index)
+
+def write_result(item: BatchQuery, result: Any, out_dir: str, results_file) -> None:
+    """Stream one finished query: result CSV plus a line in results.jsonl"""
+    start = time.perf_counter()
+    record = {'id': item.id, 'sheet': item.sheet, 'query': item.query, 'status': item.status}
+    if item.code:
+        record['code'] = item.code
+    if item.plan_steps is not None:
+        record['plan'] = item.plan_steps
+    if item.error:
+        record['error'] = item.error
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        path = os.path.join(out_dir, result_file_name(item.id))
+        result.to_csv(path, index=has_labeled_index(result))
+        record['rows'] = len(result)
+        record['output'] = path
+    elif result is not None:
+        record['value'] = repr(result)
+    item.timings['write'] = time.perf_counter() - start
+    record['timings'] = {stage: round(seconds, 4) for stage, seconds in item.timings.items()}
+    results_file.write(json.dumps(record, default=str) + '\n')
+    results_file.flush()
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(queries: List[BatchQuery], elapsed: float, load_times: Dict[str, float]) -> Dict[str, Any]:
+    """Throughput and per-stage latency summary"""
+    succeeded = sum(q.status == 'ok' for q in queries)
+    stages = {}
+    for stage in STAGES:
+        values = list(load_times.values()) if stage == 'load' else [q.timings[stage] for q in queries if stage in q.timings]
+        if values:
+            stages[stage] = {
+                'count': len(values),
+                'mean': sum(values) / len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'max': max(values),
+            }
+    return {
+        'queries': len(queries),
+        'succeeded': succeeded,
+        'failed': len(queries) - succeeded,
+        'elapsed': elapsed,
+        'queries_per_second': len(queries) / elapsed if elapsed else 0.0,
+        'stages': stages,
+    }
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    print(f"\n📊 {summary['queries']} queries in {summary['elapsed']:.2f}s "
+          f"({summary['queries_per_second']:.2f} queries/s), "
+          f"{summary['succeeded']} succeeded, {summary['failed']} failed")
+    print(f"{'stage':<8} {'count':>6} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for stage, stats in summary['stages'].items():
+        print(f"{stage:<8} {stats['count']:>6} {stats['mean'] * 1000:>10.1f} {stats['p50'] * 1000:>10.1f} "
+              f"{stats['p95'] * 1000:>10.1f} {stats['max'] * 1000:>10.1f}")
+
+def run_batch(workbook: str, queries: List[BatchQuery], out_dir: str,
+              llm_workers: int = 8, exec_workers: int = 4, agg_index: bool = False,
+              date_index: bool = False) -> Dict[str, Any]:
+    """Run all queries and stream results to `out_dir`; returns the throughput summary"""
+    from query_plan import PlanCache
+    from schema_context import summarize_schema
+
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    sheets, load_times = load_sheets(workbook, list(dict.fromkeys(q.sheet for q in queries)))
+    summaries = {}
+    agg_indexes, date_indexes = {}, {}
+    if agg_index:
+        from excel_processor import build_aggregate_index
+        agg_indexes = {sheet_name: build_aggregate_index(df) for sheet_name, df in sheets.items()}
+    if date_index:
+        from excel_processor import build_date_index
+        date_indexes = {sheet_name: build_date_index(df) for sheet_name, df in sheets.items()}
+
+    def submit_exec(item: BatchQuery):
+        return exec_pool.submit(execute, item, sheets[item.sheet], cache,
+                                agg_indexes.get(item.sheet), date_indexes.get(item.sheet))
+
+    # Shared across queries so plans with a common prefix reuse intermediate results
+    cache = PlanCache(max_entries=max(32, len(queries)))
+
+    with open(os.path.join(out_dir, 'results.jsonl'), 'w', encoding='utf-8') as results_file, \
+            ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix='llm') as llm_pool, \
+            ThreadPoolExecutor(max_workers=exec_workers, thread_name_prefix='exec') as exec_pool:
+        pending = {}
+        for item in queries:
+            df = sheets[item.sheet]
+            if item.plan_steps is not None:
+                pending[submit_exec(item)] = ('exec', item)
+            else:
+                if item.sheet not in summaries:
+                    summaries[item.sheet] = summarize_schema(df)
+                pending[llm_pool.submit(generate_code, item, df, summaries[item.sheet])] = ('llm', item)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, item = pending.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    item.status = f"{stage}_failed"
+                    item.error = str(e)
+                    write_result(item, None, out_dir, results_file)
+                    continue
+                if stage == 'llm':
+                    if item.status == 'llm_failed':
+                        write_result(item, None, out_dir, results_file)
+                    else:
+                        pending[submit_exec(item)] = ('exec', item)
+                else:
+                    item.status = 'ok'
+                    write_result(item, value, out_dir, results_file)
+
+    summary = summarize(queries, time.perf_counter() - start, load_times)
+    summary['plan_cache'] = {'hits': cache.hits, 'misses': cache.misses}
+    with open(os.path.join(out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run NL queries or query plans against a workbook without the UI")
+    parser.add_argument("workbook", help="Excel workbook (.xlsx or .xls)")
+    parser.add_argument("queries", help="JSON lines or plain text file of queries")
+    parser.add_argument("--out", default="batch_results", help="Output directory (default: batch_results)")
+    parser.add_argument("--sheet", help="Default sheet for queries without one")
+    parser.add_argument("--type", default="filter", choices=["filter", "aggregate", "sort", "pivot"],
+                        help="Default query type for queries without one")
+    parser.add_argument("--llm-workers", type=int, default=8, help="Concurrent LLM calls (rate limited by the governor)")
+    parser.add_argument("--exec-workers", type=int, default=4, help="Parallel plan executions")
+    parser.add_argument("--agg-index", action="store_true",
+                        help="Precompute an aggregate index per sheet for group-by/pivot plans")
+    parser.add_argument("--date-index", action="store_true",
+                        help="Precompute a date index per sheet for time-window filters")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    queries = read_queries(args.queries, args.sheet, args.type)
+    print(f"🚀 Running {len(queries)} queries against {args.workbook}...")
+    summary = run_batch(args.workbook, queries, args.out, args.llm_workers, args.exec_workers,
+                        args.agg_index, args.date_index)
+    print_summary(summary)
+    print(f"✅ Results written to {args.out}/")
+    sys.exit(0 if summary['failed'] == 0 else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Benchmark tooling for the Excel Sheets Agent
+
+Usage:
+    python benchmark.py importtime [--module app] [--budget-ms 1500] [--top 15]
+    python benchmark.py llm-governor [--requests 200] [--error-rate 0.3] [--rate 50]
+    python benchmark.py engines [--workbook sample_data.xlsx] [--runs 3]
+    python benchmark.py agg-index [--workbook sample_data.xlsx] [--sheet Sales_Data] [--scale 40]
+    python benchmark.py date-index [--workbook sample_data.xlsx] [--sheet Sales_Data] [--scale 40]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+# Lines look like: "import time:       123 |       4567 |   pandas.core.frame"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def measure_import_time(module: str) -> List[Dict]:
+    """Import `module` in a fresh interpreter with -X importtime and parse the report"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing '{module}' failed:\n{result.stderr}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        entries.append({
+            'module': name,
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+            # -X importtime indents nested imports by two spaces per level
+            'depth': (len(indent) - 1) // 2,
+        })
+    return entries
+
+def summarize_import_time(entries: List[Dict], module: str) -> Tuple[float, List[Dict]]:
+    """Return total import time of `module` and its direct dependencies sorted by cost"""
+    target = next((i for i, e in enumerate(entries) if e['module'] == module and e['depth'] == 0), None)
+    if target is None:
+        return 0.0, []
+    # -X importtime prints children before their parent, so the target's subtree is the run of
+    # entries between the previous top-level import and the target itself
+    start = target
+    while start > 0 and entries[start - 1]['depth'] > 0:
+        start -= 1
+    direct = [e for e in entries[start:target] if e['depth'] == 1]
+    return entries[target]['cumulative_ms'], sorted(direct, key=lambda e: e['cumulative_ms'], reverse=True)
+
+def run_importtime(args) -> bool:
+    print(f"⏱️  Measuring import time of '{args.module}' ({args.runs} runs)...")
+    totals = []
+    for _ in range(args.runs):
+        entries = measure_import_time(args.module)
+        total_ms, rows = summarize_import_time(entries, args.module)
+        totals.append(total_ms)
+
+    best_ms = min(totals)
+    print(f"\n{'module':<45} {'cumulative ms':>14} {'self ms':>10}")
+    print("-" * 71)
+    for row in rows[:args.top]:
+        print(f"{row['module']:<45} {row['cumulative_ms']:>14.1f} {row['self_ms']:>10.1f}")
+    print("-" * 71)
+    print(f"Total (best of {args.runs}): {best_ms:.1f} ms, budget: {args.budget_ms:.1f} ms")
+
+    if best_ms > args.budget_ms:
+        print(f"❌ Import of '{args.module}' exceeds budget by {best_ms - args.budget_ms:.1f} ms")
+        return False
+    print(f"✅ Import of '{args.module}' is within budget")
+    return True
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """Fake LLM endpoint that answers with pandas code and injects 429 errors"""
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.hits += 1
+            throttled = server.rng.random() < server.error_rate
+        time.sleep(server.latency)
+        if throttled:
+            self.send_response(429)
+            self.end_headers()
+            self.wfile.write(b'{"error": "RESOURCE_EXHAUSTED"}')
+            return
+        prompt = json.loads(body)['prompt']
+        payload = json.dumps({'text': f"df.head()  # {prompt}"}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_llm_server(error_rate: float, latency: float, seed: int = 42) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeLLMHandler)
+    server.error_rate = error_rate
+    server.latency = latency
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.hits = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_llm_governor(args) -> bool:
+    from llm_utils import LLMGovernor
+
+    server = start_fake_llm_server(args.error_rate, args.latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}/generate"
+    governor = LLMGovernor(rate_per_sec=args.rate, burst=args.burst, max_retries=args.max_retries,
+                           base_delay=args.backoff_base, max_delay=args.backoff_max)
+    print(f"🧪 Fake LLM at {url} (429 rate {args.error_rate:.0%}, latency {args.latency * 1000:.0f} ms)")
+
+    def send(prompt: str) -> str:
+        request = urllib.request.Request(url, data=json.dumps({'prompt': prompt}).encode(), method='POST')
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read())['text']
+
+    # Few distinct prompts so concurrent duplicates exercise single-flight coalescing
+    prompts = [f"query {i % args.distinct}" for i in range(args.requests)]
+
+    def governed(prompt: str):
+        try:
+            return governor.call(prompt, lambda: send(prompt))
+        except Exception as e:
+            return e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(governed, prompts))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    failed = sum(isinstance(r, Exception) for r in results)
+    metrics = governor.metrics()
+    print(f"\nRequests: {len(prompts)} in {elapsed:.2f}s, failed: {failed}, server hits: {server.hits}")
+    for name in ('upstream_calls', 'coalesced', 'retries', 'failures'):
+        print(f"- {name}: {metrics[name]}")
+    print(f"- queue wait avg/max: {metrics['queue_wait_avg'] * 1000:.1f} / {metrics['queue_wait_max'] * 1000:.1f} ms")
+
+    if failed:
+        print(f"❌ {failed} requests failed after retries")
+        return False
+    print("✅ All requests succeeded")
+    return True
+
+def run_engines(args) -> bool:
+    import pandas as pd
+    from excel_tools import available_engines, read_excel_sheet
+
+    if not os.path.exists(args.workbook):
+        if args.workbook != 'sample_data.xlsx':
+            print(f"❌ Workbook '{args.workbook}' not found")
+            return False
+        from create_sample_data import create_sample_data
+        create_sample_data()
+
+    engines = args.engines or available_engines()
+    if args.workbook.lower().endswith('.xlsx'):
+        # xlrd only reads legacy .xls
+        engines = [e for e in engines if e != 'xlrd']
+    sheet_names = pd.ExcelFile(args.workbook).sheet_names
+    print(f"📚 {args.workbook}: {len(sheet_names)} sheets, engines: {', '.join(engines)}")
+
+    timings: Dict[str, Dict[str, float]] = {}
+    for engine in engines:
+        timings[engine] = {}
+        for sheet_name in sheet_names:
+            best = float('inf')
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                read_excel_sheet(args.workbook, sheet_name, engine=engine)
+                best = min(best, time.perf_counter() - start)
+            timings[engine][sheet_name] = best
+
+    header = f"{'sheet':<25}" + "".join(f"{engine + ' ms':>16}" for engine in engines)
+    print(f"\n{header}\n" + "-" * len(header))
+    for sheet_name in sheet_names + ['TOTAL']:
+        row = f"{sheet_name:<25}"
+        for engine in engines:
+            value = sum(timings[engine].values()) if sheet_name == 'TOTAL' else timings[engine][sheet_name]
+            row += f"{value * 1000:>16.1f}"
+        print(row)
+
+    if 'openpyxl' in engines:
+        baseline = sum(timings['openpyxl'].values())
+        for engine in engines:
+            if engine != 'openpyxl':
+                print(f"⚡ {engine}: {baseline / sum(timings[engine].values()):.1f}x faster than openpyxl")
+    return True
+
+def run_agg_index(args) -> bool:
+    import pandas as pd
+    from aggregate_index import AggregateIndex
+    from excel_tools import aggregate_data, pivot_table, read_excel_sheet
+
+    if not os.path.exists(args.workbook):
+        from create_sample_data import create_sample_data
+        create_sample_data()
+    sheet = read_excel_sheet(args.workbook, args.sheet)
+    df = pd.concat([sheet] * args.scale, ignore_index=True)
+
+    start = time.perf_counter()
+    index = AggregateIndex.build(df)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"🧊 {args.sheet} x{args.scale}: {len(df)} rows, index over {index.dimensions} "
+          f"({len(index.cube)} cells) built in {build_ms:.1f} ms")
+
+    dims = index.dimensions
+    measure = index.measures[-1]
+    cases = [
+        (f"sum {measure} by {dims[0]}", lambda i: aggregate_data(df, [dims[0]], {measure: 'sum'}, agg_index=i)),
+        (f"mean {measure} by {dims[0]}, {dims[1]}", lambda i: aggregate_data(df, dims[:2], {measure: 'mean'}, agg_index=i)),
+        (f"max {measure} by {dims[-1]}", lambda i: aggregate_data(df, [dims[-1]], {measure: 'max'}, agg_index=i)),
+        (f"pivot {dims[0]} x {dims[1]}", lambda i: pivot_table(df, [dims[0]], [dims[1]], [measure], 'sum', agg_index=i)),
+    ]
+    print(f"\n{'query':<45} {'scan ms':>10} {'index ms':>10}")
+    print("-" * 67)
+    for name, run in cases:
+        timings = []
+        for agg_index in (None, index):
+            best = float('inf')
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                run(agg_index)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best * 1000)
+        print(f"{name:<45} {timings[0]:>10.1f} {timings[1]:>10.1f}")
+    return True
+
+def run_date_index(args) -> bool:
+    import pandas as pd
+    from date_index import DateIndex
+    from excel_tools import filter_data, read_excel_sheet
+
+    if not os.path.exists(args.workbook):
+        from create_sample_data import create_sample_data
+        create_sample_data()
+    sheet = read_excel_sheet(args.workbook, args.sheet)
+    df = pd.concat([sheet] * args.scale, ignore_index=True)
+
+    start = time.perf_counter()
+    index = DateIndex.build(df)
+    build_ms = (time.perf_counter() - start) * 1000
+    column = index.columns[0]
+    print(f"📅 {args.sheet} x{args.scale}: {len(df)} rows, index over {index.columns} built in {build_ms:.1f} ms")
+
+    dates = df[column].dropna()
+    year = int(dates.dt.year.mode()[0])
+    measure = df.select_dtypes('number').columns[-1]
+    threshold = float(df[measure].median())
+    cases = [
+        (f"Q3 {year}", f"{column}.dt.year == {year} and {column}.dt.quarter == 3"),
+        (f"Q3 {year} and {measure} > median", f"{column}.dt.year == {year} and {column}.dt.quarter == 3 and {measure} > {threshold}"),
+        ("one month window", f"{column} >= '{year}-02-01' and {column} < '{year}-03-01'"),
+        ("since 1 Dec", f"{column} >= '{year}-12-01'"),
+    ]
+    print(f"\n{'filter':<45} {'scan ms':>10} {'index ms':>10}")
+    print("-" * 67)
+    for name, conditions in cases:
+        timings = []
+        for date_index in (None, index):
+            best = float('inf')
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                filter_data(df, conditions, date_index=date_index)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best * 1000)
+        print(f"{name:<45} {timings[0]:>10.1f} {timings[1]:>10.1f}")
+    return True
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Excel Sheets Agent benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    importtime = subparsers.add_parser("importtime", help="Report module import cost (python -X importtime)")
+    importtime.add_argument("--module", default="app", help="Module to import (default: app)")
+    importtime.add_argument("--budget-ms", type=float, default=1500.0, help="Fail if import takes longer")
+    importtime.add_argument("--top", type=int, default=15, help="Number of dependencies to list")
+    importtime.add_argument("--runs", type=int, default=3, help="Take the best of N runs")
+    importtime.set_defaults(func=run_importtime)
+
+    governor = subparsers.add_parser("llm-governor", help="Load-test the LLM governor against a fake server injecting 429s")
+    governor.add_argument("--requests", type=int, default=200)
+    governor.add_argument("--distinct", type=int, default=40, help="Number of distinct prompts")
+    governor.add_argument("--concurrency", type=int, default=16)
+    governor.add_argument("--error-rate", type=float, default=0.3, help="Fraction of upstream calls answered with 429")
+    governor.add_argument("--latency", type=float, default=0.02, help="Fake upstream latency in seconds")
+    governor.add_argument("--rate", type=float, default=50.0, help="Token bucket rate (calls/second)")
+    governor.add_argument("--burst", type=int, default=10)
+    governor.add_argument("--max-retries", type=int, default=6)
+    governor.add_argument("--backoff-base", type=float, default=0.05)
+    governor.add_argument("--backoff-max", type=float, default=1.0)
+    governor.set_defaults(func=run_llm_governor)
+
+    engines = subparsers.add_parser("engines", help="Compare Excel reader engines on a workbook")
+    engines.add_argument("--workbook", default="sample_data.xlsx", help="Generated with create_sample_data.py if missing")
+    engines.add_argument("--engines", nargs="+", help="Engines to compare (default: all installed)")
+    engines.add_argument("--runs", type=int, default=3, help="Take the best of N runs per sheet")
+    engines.set_defaults(func=run_engines)
+
+    agg_index = subparsers.add_parser("agg-index", help="Compare full-scan aggregations with the aggregate index")
+    agg_index.add_argument("--workbook", default="sample_data.xlsx", help="Generated with create_sample_data.py if missing")
+    agg_index.add_argument("--sheet", default="Sales_Data")
+    agg_index.add_argument("--scale", type=int, default=40, help="Replicate the sheet N times")
+    agg_index.add_argument("--runs", type=int, default=5, help="Take the best of N runs")
+    agg_index.set_defaults(func=run_agg_index)
+
+    date_index = subparsers.add_parser("date-index", help="Compare full-scan date filters with the date index")
+    date_index.add_argument("--workbook", default="sample_data.xlsx", help="Generated with create_sample_data.py if missing")
+    date_index.add_argument("--sheet", default="Sales_Data")
+    date_index.add_argument("--scale", type=int, default=40, help="Replicate the sheet N times")
+    date_index.add_argument("--runs", type=int, default=5, help="Take the best of N runs")
+    date_index.set_defaults(func=run_date_index)
+
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    ok = args.func(args)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
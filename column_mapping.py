@@ -49,6 +49,26 @@ def map_with_synonyms(header: str, candidates: List[str]) -> Optional[str]:
             return match[0]
     return None
 
+def rank_columns_by_relevance(query: str, candidates: List[str]) -> List[Tuple[str, float]]:
+    """
+    Rank candidate columns by how strongly the query mentions them (fuzzy + synonym matching,
+    no LLM). Returns (column, score 0-100) sorted by score; ties keep the sheet order.
+    """
+    query_tokens = set(normalize_header(query).split('_')) - {''}
+    query_tokens |= {SYNONYM_DICT[t] for t in query_tokens if t in SYNONYM_DICT}
+    scored = []
+    for column in candidates:
+        norm_column = normalize_header(str(column))
+        parts = [p for p in norm_column.split('_') if p] or [norm_column]
+        part_scores = [
+            max((fuzz.ratio(part, token) for token in query_tokens), default=0)
+            for part in parts
+        ]
+        # A column is relevant if any of its words is mentioned; full-name mentions rank highest
+        score = max(part_scores) * 0.7 + (sum(part_scores) / len(part_scores)) * 0.3
+        scored.append((column, score))
+    return sorted(scored, key=lambda item: item[1], reverse=True)
+
 def suggest_column_mapping_with_llm(user_header: str, candidates: List[str]) -> Optional[str]:
     """Use LLM to suggest a mapping for an ambiguous column name."""
     prompt = (
@@ -0,0 +1,292 @@
+"""
+Date index: sorted positions of datetime columns for fast time-window filtering.
+
+Time-window predicates in filter conditions ("Date >= '2024-07-01' and Date < '2024-10-01'",
+"Date.dt.year == 2024 and Date.dt.quarter == 3") become binary-search slices of the sorted
+dates; the remaining predicates run with df.query on that slice only. Last activity per key
+(e.g. per customer) is precomputed so "hasn't ordered in 6 months" doesn't rescan the sheet.
+"""
+import logging
+import re
+import weakref
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columns treated as entity keys for last-activity lookups
+KEY_COLUMN_PATTERN = re.compile(r'customer|client|account', re.IGNORECASE)
+
+_COLUMN = r'`([^`]+)`|([A-Za-z_][A-Za-z0-9_]*)'
+_LITERAL = r"""'([^']*)'|"([^"]*)\""""
+# Only range comparisons: df.query doesn't match `Date == '2024-05-05'` the way a
+# Timestamp comparison would, so equality is left to df.query to keep results identical
+_COMPARE_PATTERN = re.compile(rf'^(?:{_COLUMN})\s*(>=|<=|>|<)\s*(?:{_LITERAL})$')
+_REVERSED_PATTERN = re.compile(rf'^(?:{_LITERAL})\s*(>=|<=|>|<)\s*(?:{_COLUMN})$')
+_PERIOD_PATTERN = re.compile(rf'^(?:{_COLUMN})\.dt\.(year|quarter|month)\s*==\s*(\d+)$')
+_FLIPPED_OPS = {'>=': '<=', '<=': '>=', '>': '<', '<': '>'}
+
+# Bounds are (lower, lower_inclusive, upper, upper_inclusive); None means unbounded
+Bounds = Tuple[Optional[pd.Timestamp], bool, Optional[pd.Timestamp], bool]
+
+def _split_conjunction(conditions: str) -> Optional[List[str]]:
+    """
+    Split on top-level 'and' / '&'; None if the expression has a top-level 'or'.
+    Quoted literals and backtick-quoted column names (`Brand and Co`) are never split.
+    """
+    clauses, depth, quote, current = [], 0, None, ''
+    tokens = re.split(r'''(\(|\)|'|"|`|\s+and\s+|\s+or\s+|&|\|)''', conditions, flags=re.IGNORECASE)
+    for token in tokens:
+        if not token:
+            continue
+        lowered = token.strip().lower()
+        if quote:
+            quote = None if token == quote else quote
+            current += token
+        elif token in ("'", '"', '`'):
+            quote = token
+            current += token
+        elif token == '(':
+            depth += 1
+            current += token
+        elif token == ')':
+            depth -= 1
+            current += token
+        elif depth == 0 and lowered in ('and', '&'):
+            clauses.append(current.strip())
+            current = ''
+        elif depth == 0 and lowered in ('or', '|'):
+            return None
+        else:
+            current += token
+    clauses.append(current.strip())
+    return [_strip_parens(clause) for clause in clauses if clause]
+
+def _strip_parens(clause: str) -> str:
+    """Remove parentheses that wrap the whole clause, e.g. "((Date > '2024-01-01'))"."""
+    while clause.startswith('(') and clause.endswith(')'):
+        depth, quote = 0, None
+        for i, char in enumerate(clause):
+            if quote:
+                quote = None if char == quote else quote
+            elif char in ("'", '"', '`'):
+                quote = char
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+                if depth == 0 and i < len(clause) - 1:
+                    return clause  # First '(' closes before the end: "(a) and (b)"
+        clause = clause[1:-1].strip()
+    return clause
+
+def _intersect(bounds: Bounds, other: Bounds) -> Bounds:
+    lower, lower_inc, upper, upper_inc = bounds
+    o_lower, o_lower_inc, o_upper, o_upper_inc = other
+    if o_lower is not None and (lower is None or o_lower > lower or (o_lower == lower and not o_lower_inc)):
+        lower, lower_inc = o_lower, o_lower_inc
+    if o_upper is not None and (upper is None or o_upper < upper or (o_upper == upper and not o_upper_inc)):
+        upper, upper_inc = o_upper, o_upper_inc
+    return lower, lower_inc, upper, upper_inc
+
+def _comparison_bounds(op: str, value: pd.Timestamp) -> Bounds:
+    return {
+        '>=': (value, True, None, False),
+        '>': (value, False, None, False),
+        '<=': (None, False, value, True),
+        '<': (None, False, value, False),
+    }[op]
+
+def _as_unit(value: pd.Timestamp, dtype: np.dtype) -> np.datetime64:
+    """Convert a bound to the column's datetime64 unit, refusing values that would overflow or lose precision."""
+    original = np.datetime64(value)
+    converted = original.astype(dtype)
+    if np.isnat(converted) or converted.astype(original.dtype) != original:
+        raise ValueError(f"{value} can't be represented as {dtype}")
+    return converted
+
+class DateIndex:
+    """Sorted row positions per datetime column, plus precomputed last activity per key."""
+
+    def __init__(self, sorted_values: Dict[str, np.ndarray], sorted_positions: Dict[str, np.ndarray],
+                 last_activity: Dict[Tuple[str, str], pd.Series], source: pd.DataFrame):
+        self.sorted_values = sorted_values
+        self.sorted_positions = sorted_positions
+        self.columns = list(sorted_values)
+        self._last_activity = last_activity
+        self._source = weakref.ref(source)
+        self._source_shape = source.shape
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, columns: Optional[List[str]] = None,
+              key_columns: Optional[List[str]] = None) -> 'DateIndex':
+        """
+        Index the given (default: all timezone-naive datetime) columns and precompute the
+        last date per value of each key column (default: customer/client/account columns).
+        """
+        if columns is None:
+            columns = [
+                column for column in df.columns
+                if pd.api.types.is_datetime64_dtype(df[column])
+            ]
+        if not columns:
+            raise ValueError("No datetime columns to index")
+
+        sorted_values, sorted_positions = {}, {}
+        for column in columns:
+            # Keep the column's own unit: pandas may read Excel dates as datetime64[us] or [s],
+            # and casting to [ns] would silently wrap dates outside 1677-2262 (e.g. 9999-12-31)
+            values = df[column].to_numpy()
+            valid = np.flatnonzero(~np.isnat(values))
+            order = valid[np.argsort(values[valid], kind='stable')]
+            sorted_positions[column] = order
+            sorted_values[column] = values[order]
+
+        if key_columns is None:
+            key_columns = [
+                column for column in df.columns
+                if column not in columns
+                and not pd.api.types.is_numeric_dtype(df[column])
+                and KEY_COLUMN_PATTERN.search(str(column))
+            ]
+        last_activity = {
+            (key, column): df.groupby(key)[column].max()
+            for key in key_columns for column in columns
+        }
+
+        logger.info(f"Built date index over {columns} (last activity by {key_columns}) for {len(df)} rows")
+        return cls(sorted_values, sorted_positions, last_activity, df)
+
+    def covers(self, df: pd.DataFrame) -> bool:
+        """True if the index was built from this exact frame."""
+        return self._source() is df and df.shape == self._source_shape
+
+    def positions(self, column: str, bounds: Bounds) -> np.ndarray:
+        """
+        Row positions with dates inside `bounds`, in original row order.
+        Raises ValueError if a bound can't be represented exactly in the column's unit.
+        """
+        lower, lower_inc, upper, upper_inc = bounds
+        values = self.sorted_values[column]
+        start = 0 if lower is None else np.searchsorted(
+            values, _as_unit(lower, values.dtype), side='left' if lower_inc else 'right')
+        stop = len(values) if upper is None else np.searchsorted(
+            values, _as_unit(upper, values.dtype), side='right' if upper_inc else 'left')
+        return np.sort(self.sorted_positions[column][start:max(start, stop)])
+
+    def period_bounds(self, year: int, quarter: Optional[int] = None, month: Optional[int] = None) -> Bounds:
+        """Half-open [start, end) range of a year, quarter or month."""
+        if month is not None:
+            start = pd.Timestamp(year=year, month=month, day=1)
+            end = start + pd.DateOffset(months=1)
+        elif quarter is not None:
+            start = pd.Timestamp(year=year, month=3 * (quarter - 1) + 1, day=1)
+            end = start + pd.DateOffset(months=3)
+        else:
+            start = pd.Timestamp(year=year, month=1, day=1)
+            end = start + pd.DateOffset(years=1)
+        return start, True, end, False
+
+    def filter(self, df: pd.DataFrame, conditions: str) -> Optional[pd.DataFrame]:
+        """
+        Answer a df.query condition by slicing on its date predicates first.
+        Returns None when the condition has no usable date predicate (caller does a full query).
+        """
+        clauses = _split_conjunction(conditions)
+        if not clauses:
+            return None
+
+        bounds: Dict[str, Bounds] = {}
+        periods: Dict[str, Dict[str, int]] = {}
+        consumed: Dict[str, List[str]] = {}
+        residual: List[str] = []
+        for clause in clauses:
+            parsed = self._parse_clause(clause)
+            if parsed is None:
+                residual.append(clause)
+                continue
+            column, kind, value = parsed
+            if kind == 'bounds':
+                bounds[column] = _intersect(bounds.get(column, (None, False, None, False)), value)
+            elif value[0] not in periods.setdefault(column, {}):
+                periods[column][value[0]] = value[1]
+            else:
+                residual.append(clause)
+                continue
+            consumed.setdefault(column, []).append(clause)
+
+        for column, parts in periods.items():
+            if 'year' not in parts or ('quarter' in parts and 'month' in parts):
+                # Not a single contiguous range; evaluate these clauses normally
+                period_clauses = [c for c in consumed[column] if self._parse_clause(c)[1] == 'period']
+                residual.extend(period_clauses)
+                consumed[column] = [c for c in consumed[column] if c not in period_clauses]
+                continue
+            period = self.period_bounds(parts['year'], parts.get('quarter'), parts.get('month'))
+            bounds[column] = _intersect(bounds.get(column, (None, False, None, False)), period)
+
+        if not bounds:
+            return None
+        # Slice on one indexed column; predicates on other date columns run on the slice
+        column = next(iter(bounds))
+        for other in bounds:
+            if other != column:
+                residual.extend(consumed[other])
+        try:
+            positions = self.positions(column, bounds[column])
+        except ValueError:
+            return None  # Bound outside the column's datetime range; let df.query decide
+        if not residual:
+            return df.iloc[positions]
+        expression = " and ".join(f"({clause})" for clause in residual)
+        # Evaluate the remaining predicates on just the columns they mention, then take the
+        # matching rows once (df.query is eval + loc, so the result is the same)
+        referenced = [c for c in df.columns if str(c) in expression]
+        try:
+            mask = df[referenced].iloc[positions].eval(expression)
+            if not pd.api.types.is_bool_dtype(mask):
+                raise TypeError("Condition did not evaluate to a boolean mask")
+            return df.iloc[positions[np.asarray(mask, dtype=bool)]]
+        except Exception:
+            return df.iloc[positions].query(expression)
+
+    def _parse_clause(self, clause: str):
+        """Return (column, 'bounds', Bounds) or (column, 'period', (part, number)) or None."""
+        match = _COMPARE_PATTERN.match(clause)
+        if match:
+            column = match.group(1) or match.group(2)
+            op, literal = match.group(3), match.group(4) if match.group(4) is not None else match.group(5)
+        else:
+            match = _REVERSED_PATTERN.match(clause)
+            if match:
+                literal = match.group(1) if match.group(1) is not None else match.group(2)
+                op, column = _FLIPPED_OPS[match.group(3)], match.group(4) or match.group(5)
+            else:
+                match = _PERIOD_PATTERN.match(clause)
+                if not match:
+                    return None
+                column = match.group(1) or match.group(2)
+                if column not in self.sorted_values:
+                    return None
+                return column, 'period', (match.group(3), int(match.group(4)))
+        if column not in self.sorted_values:
+            return None
+        try:
+            value = pd.Timestamp(literal)
+        except (ValueError, TypeError):
+            return None
+        if value.tzinfo is not None:
+            return None
+        return column, 'bounds', _comparison_bounds(op, value)
+
+    def last_activity(self, df: pd.DataFrame, key: str, column: str) -> pd.Series:
+        """
+        Latest `column` date per value of `key`: precomputed for key columns at build time,
+        computed on the fly (and not cached) for frames the index wasn't built from.
+        """
+        if not self.covers(df):
+            return df.groupby(key)[column].max()
+        if (key, column) not in self._last_activity:
+            self._last_activity[(key, column)] = df.groupby(key)[column].max()
+        return self._last_activity[(key, column)]
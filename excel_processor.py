@@ -0,0 +1,199 @@
+"""
+Workbook loading and per-sheet index building, shared by the Streamlit app and the
+headless batch runner. Kept free of streamlit so batch runs don't import the UI stack.
+"""
+import logging
+import time
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+import pandas as pd
+from excel_tools import read_excel_sheet, select_engine
+
+logger = logging.getLogger(__name__)
+
+def log_event(event: str, **kwargs):
+    with open("app_metrics.log", "a") as f:
+        f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} | {event} | {kwargs}\n")
+
+class ExcelProcessor:
+    """Memory-efficient Excel file processor with multi-sheet support"""
+    
+    def __init__(self, on_error: Optional[Callable[[str], Any]] = None):
+        # Called with a user-facing message when a load fails (the app passes st.error)
+        self.on_error = on_error
+        self.workbook = None
+        self.file_name = ''
+        self.engine = None
+        self.sheet_names = []
+        self.current_sheet = None
+        self.chunk_size = 1000  # Process 1000 rows at a time
+    
+    def load_excel_file(self, uploaded_file) -> bool:
+        """Load Excel file and extract sheet information"""
+        try:
+            # Read the uploaded file into BytesIO
+            file_bytes = BytesIO(uploaded_file.read())
+            self.file_name = getattr(uploaded_file, 'name', '') or ''
+            self.engine = select_engine(self.file_name)
+            
+            if self.file_name.lower().endswith('.xls'):
+                # Legacy .xls can't be opened by openpyxl; list sheets through the reader engine
+                self.workbook = None
+                self.sheet_names = pd.ExcelFile(file_bytes, engine=self.engine).sheet_names
+            else:
+                # Load workbook with openpyxl for sheet info (imported lazily to keep cold start fast)
+                import openpyxl
+                self.workbook = openpyxl.load_workbook(file_bytes, read_only=True)
+                self.sheet_names = self.workbook.sheetnames
+            
+            # Reset file pointer for pandas
+            file_bytes.seek(0)
+            self.file_bytes = file_bytes
+            
+            logger.info(f"Successfully loaded Excel file with {len(self.sheet_names)} sheets")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error loading Excel file: {str(e)}")
+            self._report_error(f"Error loading Excel file: {str(e)}")
+            return False
+    
+    def _report_error(self, message: str) -> None:
+        if self.on_error is not None:
+            self.on_error(message)
+
+    def get_sheet_info(self) -> Dict[str, Any]:
+        """Get information about all sheets in the workbook"""
+        from openpyxl.utils import get_column_letter
+        sheet_info = {}
+        
+        for sheet_name in self.sheet_names:
+            try:
+                sheet = self.workbook[sheet_name] if self.workbook is not None else self._get_sheet_dimensions(sheet_name)
+                sheet_info[sheet_name] = {
+    'max_row': sheet.max_row,
+    'max_column': sheet.max_column,
+    # 'dimensions': sheet.dimensions,  # Removed unsupported attribute
+    'range': f"A1:{get_column_letter(sheet.max_column)}{sheet.max_row}" if sheet.max_row and sheet.max_column else 'Unknown'
+}
+            except Exception as e:
+                logger.warning(f"Could not get info for sheet {sheet_name}: {str(e)}")
+                sheet_info[sheet_name] = {'error': str(e)}
+        
+        return sheet_info
+    
+    def _get_sheet_dimensions(self, sheet_name: str):
+        """Sheet dimensions for workbooks openpyxl can't open (.xls), via the reader engine"""
+        from types import SimpleNamespace
+        self.file_bytes.seek(0)
+        if self.engine == 'calamine':
+            from python_calamine import CalamineWorkbook
+            sheet = CalamineWorkbook.from_filelike(self.file_bytes).get_sheet_by_name(sheet_name)
+            return SimpleNamespace(max_row=sheet.height, max_column=sheet.width)
+        sheet = pd.ExcelFile(self.file_bytes, engine=self.engine).book.sheet_by_name(sheet_name)
+        return SimpleNamespace(max_row=sheet.nrows, max_column=sheet.ncols)
+    
+    def read_sheet_chunked(self, sheet_name: str, chunk_size: Optional[int] = None) -> pd.DataFrame:
+        """Read a specific sheet with chunking for memory efficiency"""
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        
+        try:
+            # Reset file pointer
+            self.file_bytes.seek(0)
+            
+            # Read the specific sheet with the fastest installed engine (falls back to openpyxl)
+            df = read_excel_sheet(
+                self.file_bytes,
+                sheet_name=sheet_name,
+                file_name=self.file_name,
+                engine=self.engine
+            )
+            
+            # Detect and convert data types
+            df = self._detect_and_convert_types(df)
+            
+            logger.info(f"Successfully read sheet '{sheet_name}' with {len(df)} rows and {len(df.columns)} columns")
+            return df
+            
+        except Exception as e:
+            logger.error(f"Error reading sheet {sheet_name}: {str(e)}")
+            self._report_error(f"Error reading sheet {sheet_name}: {str(e)}")
+            return pd.DataFrame()
+    
+    def _detect_and_convert_types(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Detect and convert data types for better performance"""
+        for column in df.columns:
+            try:
+                # Try to convert to numeric
+                if df[column].dtype == 'object':
+                    # Check if it's a date
+                    if self._is_date_column(df[column]):
+                        df[column] = pd.to_datetime(df[column], errors='coerce')
+                    else:
+                        # Try numeric conversion
+                        numeric_series = pd.to_numeric(df[column], errors='coerce')
+                        if not numeric_series.isna().all():
+                            df[column] = numeric_series
+            except Exception as e:
+                logger.warning(f"Could not convert column {column}: {str(e)}")
+                continue
+        
+        return df
+    
+    def _is_date_column(self, series: pd.Series) -> bool:
+        """Check if a series contains date-like values"""
+        sample_size = min(100, len(series))
+        sample = series.dropna().head(sample_size)
+        
+        if len(sample) == 0:
+            return False
+        
+        date_count = 0
+        for value in sample:
+            try:
+                pd.to_datetime(value)
+                date_count += 1
+            except:
+                continue
+        
+        # If more than 50% of samples are dates, consider it a date column
+        return (date_count / len(sample)) > 0.5
+    
+    def get_column_info(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """Get detailed information about columns"""
+        column_info = {}
+        
+        for column in df.columns:
+            column_info[column] = {
+                'dtype': str(df[column].dtype),
+                'null_count': df[column].isnull().sum(),
+                'unique_count': df[column].nunique(),
+                'sample_values': df[column].dropna().head(5).tolist()
+            }
+        
+        return column_info
+
+def build_aggregate_index(df: pd.DataFrame):
+    """Build the optional aggregate index for a freshly loaded sheet, or None if nothing to index."""
+    from aggregate_index import AggregateIndex
+    start = time.time()
+    try:
+        index = AggregateIndex.build(df)
+    except Exception as e:
+        logger.warning(f"Aggregate index not built: {str(e)}")
+        return None
+    log_event("agg_index_built", dimensions=index.dimensions, cells=len(index.cube), elapsed=time.time() - start)
+    return index
+
+def build_date_index(df: pd.DataFrame):
+    """Build the optional date index for a freshly loaded sheet, or None if it has no date columns."""
+    from date_index import DateIndex
+    start = time.time()
+    try:
+        index = DateIndex.build(df)
+    except Exception as e:
+        logger.warning(f"Date index not built: {str(e)}")
+        return None
+    log_event("date_index_built", columns=index.columns, elapsed=time.time() - start)
+    return index
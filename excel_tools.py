@@ -1,31 +1,139 @@
 """
 Reusable Excel worksheet tools for LangChain and app integration.
 """
+import importlib.util
+import logging
+import os
 import pandas as pd
 from typing import List, Optional, Dict, Any
+from aggregate_index import MONTH_SUFFIX
 
-def read_worksheet(excel_file: str, sheet_name: str) -> pd.DataFrame:
+logger = logging.getLogger(__name__)
+
+# Reader engines in order of preference. calamine (python-calamine, pandas >= 2.2) is a
+# compiled reader for .xlsx and .xls; openpyxl is the pure-Python fallback; xlrd reads .xls.
+READER_ENGINES = {
+    'calamine': 'python_calamine',
+    'openpyxl': 'openpyxl',
+    'xlrd': 'xlrd',
+}
+# Engines that can read each file type (openpyxl can't open .xls; xlrd 2.x only reads .xls)
+XLS_ENGINES = ('calamine', 'xlrd')
+XLSX_ENGINES = ('calamine', 'openpyxl')
+
+def _pandas_supports_calamine() -> bool:
+    major, minor = (int(part) for part in pd.__version__.split('.')[:2])
+    return (major, minor) >= (2, 2)
+
+def available_engines() -> List[str]:
+    """Return the installed reader engines, fastest first."""
+    engines = []
+    for engine, module in READER_ENGINES.items():
+        if importlib.util.find_spec(module) is None:
+            continue
+        if engine == 'calamine' and not _pandas_supports_calamine():
+            continue
+        engines.append(engine)
+    return engines
+
+def select_engine(file_name: Optional[str] = None, prefer: Optional[str] = None) -> str:
+    """
+    Pick a reader engine for the file: `prefer` (or EXCEL_READER_ENGINE) when installed and
+    able to read the file type, otherwise calamine, otherwise openpyxl for .xlsx / xlrd for .xls.
+    An explicit `prefer` that can't read the file raises; a mismatched EXCEL_READER_ENGINE
+    is ignored, since it applies to every file.
+    """
+    engines = available_engines()
+    is_xls = str(file_name or '').lower().endswith('.xls')
+    supported = XLS_ENGINES if is_xls else XLSX_ENGINES
+    file_type = '.xls' if is_xls else '.xlsx'
+    if prefer:
+        if prefer not in supported:
+            raise ValueError(f"Reader engine '{prefer}' can't read {file_type} files (use one of {list(supported)})")
+        if prefer not in engines:
+            raise ValueError(f"Reader engine '{prefer}' is not installed (available: {engines})")
+        return prefer
+    override = os.environ.get('EXCEL_READER_ENGINE')
+    if override:
+        if override not in supported:
+            logger.warning(f"Ignoring EXCEL_READER_ENGINE='{override}': it can't read {file_type} files")
+        elif override not in engines:
+            raise ValueError(f"Reader engine '{override}' is not installed (available: {engines})")
+        else:
+            return override
+    if 'calamine' in engines:
+        return 'calamine'
+    if is_xls:
+        if 'xlrd' in engines:
+            return 'xlrd'
+        raise ValueError("Reading .xls files requires python-calamine or xlrd")
+    return 'openpyxl'
+
+def read_excel_sheet(source: Any, sheet_name: str, file_name: Optional[str] = None,
+                     engine: Optional[str] = None) -> pd.DataFrame:
+    """
+    Read one sheet with the selected engine, retrying with openpyxl when a fast engine
+    can't handle the workbook. `source` is a path or a seekable file-like object.
+    """
+    if file_name is None and isinstance(source, (str, os.PathLike)):
+        file_name = os.fspath(source)
+    engine = engine or select_engine(file_name)
+    try:
+        return pd.read_excel(source, sheet_name=sheet_name, engine=engine)
+    except Exception as e:
+        is_xls = str(file_name or '').lower().endswith('.xls')
+        if engine == 'openpyxl' or is_xls:
+            raise
+        logger.warning(f"Engine '{engine}' failed on sheet '{sheet_name}' ({e}); falling back to openpyxl")
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return pd.read_excel(source, sheet_name=sheet_name, engine='openpyxl')
+
+def read_worksheet(excel_file: str, sheet_name: str, engine: Optional[str] = None) -> pd.DataFrame:
     """Read a worksheet from an Excel file."""
     try:
-        df = pd.read_excel(excel_file, sheet_name=sheet_name, engine='openpyxl')
+        df = read_excel_sheet(excel_file, sheet_name, engine=engine)
         return df
     except Exception as e:
         raise RuntimeError(f"Failed to read worksheet '{sheet_name}': {e}")
 
-def filter_data(df: pd.DataFrame, conditions: str) -> pd.DataFrame:
-    """Filter DataFrame using a pandas query string."""
+def filter_data(df: pd.DataFrame, conditions: str, date_index: Optional[Any] = None) -> pd.DataFrame:
+    """Filter DataFrame using a pandas query string.
+    date_index: optional DateIndex built from df; date-range predicates become binary-search slices
+    """
     try:
+        if date_index is not None and date_index.covers(df):
+            filtered = date_index.filter(df, conditions)
+            if filtered is not None:
+                return filtered
         filtered = df.query(conditions)
         return filtered
     except Exception as e:
         raise RuntimeError(f"Failed to filter data: {e}")
 
-def aggregate_data(df: pd.DataFrame, group_by: List[str], metrics: Dict[str, str]) -> pd.DataFrame:
+def with_month_dimensions(df: pd.DataFrame, names: List[str]) -> pd.DataFrame:
+    """Add the derived `<date column>_month` dimensions named in `names` that df lacks,
+    so plans grouping by e.g. Date_month work with or without an aggregate index.
+    """
+    derived = {}
+    for name in names:
+        if name in df.columns or not isinstance(name, str) or not name.endswith(MONTH_SUFFIX):
+            continue
+        base = name[:-len(MONTH_SUFFIX)]
+        if base in df.columns and pd.api.types.is_datetime64_any_dtype(df[base]):
+            derived[name] = df[base].dt.to_period('M')
+    return df.assign(**derived) if derived else df
+
+def aggregate_data(df: pd.DataFrame, group_by: List[str], metrics: Dict[str, str],
+                   agg_index: Optional[Any] = None) -> pd.DataFrame:
     """Aggregate data using groupby and specified metrics.
     metrics: e.g. { 'Sales': 'sum', 'Quantity': 'mean' }
+    agg_index: optional AggregateIndex built from df; compatible queries skip the full scan
     """
     try:
-        agg_df = df.groupby(group_by).agg(metrics).reset_index()
+        if agg_index is not None and agg_index.covers(df) and agg_index.can_answer(group_by, metrics):
+            return agg_index.aggregate(group_by, metrics)
+        agg_df = with_month_dimensions(df, group_by).groupby(group_by).agg(metrics).reset_index()
         return agg_df
     except Exception as e:
         raise RuntimeError(f"Failed to aggregate data: {e}")
@@ -40,14 +148,38 @@ def sort_data(df: pd.DataFrame, by: List[str], ascending: Optional[List[bool]] =
     except Exception as e:
         raise RuntimeError(f"Failed to sort data: {e}")
 
-def pivot_table(df: pd.DataFrame, index: List[str], columns: List[str], values: List[str], aggfunc: str = 'sum') -> pd.DataFrame:
-    """Create a pivot table from DataFrame."""
+def pivot_table(df: pd.DataFrame, index: List[str], columns: List[str], values: List[str], aggfunc: str = 'sum',
+                agg_index: Optional[Any] = None) -> pd.DataFrame:
+    """Create a pivot table from DataFrame.
+    agg_index: optional AggregateIndex built from df; compatible pivots skip the full scan
+    """
     try:
+        if (agg_index is not None and agg_index.covers(df) and isinstance(aggfunc, str)
+                and agg_index.can_answer(list(index) + list(columns), {value: aggfunc for value in values})):
+            return agg_index.pivot(index, columns, values, aggfunc)
+        df = with_month_dimensions(df, list(index) + list(columns))
         pivot = pd.pivot_table(df, index=index, columns=columns, values=values, aggfunc=aggfunc, fill_value=0)
         return pivot.reset_index()
     except Exception as e:
         raise RuntimeError(f"Failed to create pivot table: {e}")
 
+def last_activity(df: pd.DataFrame, key: str, date_column: str, inactive_since: Optional[str] = None,
+                  date_index: Optional[Any] = None) -> pd.DataFrame:
+    """Latest date per key (e.g. last order per customer), optionally only keys with no
+    activity on or after `inactive_since` ("customers who haven't ordered since 2024-06-01").
+    date_index: optional DateIndex built from df; last activity per key is precomputed
+    """
+    try:
+        if date_index is not None and date_index.covers(df):
+            last = date_index.last_activity(df, key, date_column)
+        else:
+            last = df.groupby(key)[date_column].max()
+        if inactive_since is not None:
+            last = last[last < pd.Timestamp(inactive_since)]
+        return last.reset_index()
+    except Exception as e:
+        raise RuntimeError(f"Failed to compute last activity: {e}")
+
 # (Optional) Advanced tool stubs for next phases
 def merge_worksheets(*args, **kwargs):
     raise NotImplementedError("merge_worksheets is not implemented yet.")
@@ -1,62 +1,84 @@
 import os
-from typing import Dict, Any, Optional
-from langchain_google_genai import GoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
+import random
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Callable, Dict, Any, Optional, Union
 
-# Load environment variables
-load_dotenv()
+# langchain, langchain_google_genai and python-dotenv are imported lazily on first
+# use: they dominate import time and most sessions never issue an LLM query.
+
+@lru_cache(maxsize=1)
+def _load_env() -> None:
+    """Load environment variables from .env once."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+@lru_cache(maxsize=4)
+def _build_gemini_llm(model_name: str, api_key: str):
+    from langchain_google_genai import GoogleGenerativeAI
+    return GoogleGenerativeAI(model=model_name, google_api_key=api_key)
 
 def get_gemini_llm():
     """Return a Gemini LLM instance using langchain-google-genai."""
+    _load_env()
     model_name = os.environ.get("GEMINI_MODEL_NAME", "gemini-pro")
     api_key = os.environ.get("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError("GOOGLE_API_KEY is not set in environment variables.")
-    return GoogleGenerativeAI(model=model_name, google_api_key=api_key)
+    return _build_gemini_llm(model_name, api_key)
 
-# Prompt templates for different query types
-PROMPT_TEMPLATES = {
-    "filter": PromptTemplate(
-        input_variables=["query", "columns"],
-        template=(
-            "You are an expert data analyst. Given the following columns: {columns}, "
-            "translate the user's request into a pandas filter expression. "
-            "User request: '{query}'\n"
-            "Return only the pandas filter code (e.g., df[df['Region'] == 'Delhi'])"
-        ),
+# Prompt texts for different query types; wrapped in PromptTemplate on first use
+PROMPT_TEXTS = {
+    "filter": (
+        "You are an expert data analyst. Given the following columns: {columns}, "
+        "translate the user's request into a pandas filter expression. "
+        "User request: '{query}'\n"
+        "Return only the pandas filter code (e.g., df[df['Region'] == 'Delhi'])"
     ),
-    "aggregate": PromptTemplate(
-        input_variables=["query", "columns"],
-        template=(
-            "Given columns: {columns}, translate the user's aggregation query into a pandas groupby/agg expression. "
-            "User request: '{query}'\n"
-            "Return only the pandas code."
-        ),
+    "aggregate": (
+        "Given columns: {columns}, translate the user's aggregation query into a pandas groupby/agg expression. "
+        "User request: '{query}'\n"
+        "Return only the pandas code."
     ),
-    "sort": PromptTemplate(
-        input_variables=["query", "columns"],
-        template=(
-            "Given columns: {columns}, translate the user's sorting/grouping query into a pandas sort_values or groupby expression. "
-            "User request: '{query}'\n"
-            "Return only the pandas code."
-        ),
+    "sort": (
+        "Given columns: {columns}, translate the user's sorting/grouping query into a pandas sort_values or groupby expression. "
+        "User request: '{query}'\n"
+        "Return only the pandas code."
     ),
-    "pivot": PromptTemplate(
-        input_variables=["query", "columns"],
-        template=(
-            "Given columns: {columns}, translate the user's pivot table query into a pandas pivot_table expression. "
-            "User request: '{query}'\n"
-            "Return only the pandas code."
-        ),
+    "pivot": (
+        "Given columns: {columns}, translate the user's pivot table query into a pandas pivot_table expression. "
+        "User request: '{query}'\n"
+        "Return only the pandas code."
     ),
 }
 
-def get_prompt(query_type: str, query: str, columns: list) -> str:
-    """Render the appropriate prompt for the query type."""
-    if query_type not in PROMPT_TEMPLATES:
+@lru_cache(maxsize=1)
+def _build_prompt_templates() -> Dict[str, Any]:
+    from langchain.prompts import PromptTemplate
+    return {
+        query_type: PromptTemplate(input_variables=["query", "columns"], template=text)
+        for query_type, text in PROMPT_TEXTS.items()
+    }
+
+def __getattr__(name: str) -> Any:
+    # Keep `llm_utils.PROMPT_TEMPLATES` available without importing langchain at module load
+    if name == "PROMPT_TEMPLATES":
+        return _build_prompt_templates()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_prompt(query_type: str, query: str, columns: Union[list, str]) -> str:
+    """Render the appropriate prompt for the query type.
+    columns: a list of column names or a pre-rendered schema context string
+    """
+    if query_type not in PROMPT_TEXTS:
         raise ValueError(f"Unknown query type: {query_type}")
-    return PROMPT_TEMPLATES[query_type].format(query=query, columns=columns)
+    return _build_prompt_templates()[query_type].format(query=query, columns=columns)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for cost/budget tracking (~4 characters per token)."""
+    return max(1, (len(text) + 3) // 4)
 
 def parse_llm_response(response: str) -> Optional[str]:
     """Extract pandas code from LLM response."""
@@ -66,14 +88,178 @@ def parse_llm_response(response: str) -> Optional[str]:
         return code
     return None
 
-def run_gemini_query(query_type: str, query: str, columns: list) -> Optional[str]:
-    """Send prompt to Gemini LLM and return pandas code string."""
+class TokenBucket:
+    """Thread-safe token-bucket rate limiter: `rate` tokens/second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("TokenBucket needs rate > 0 and capacity >= 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Block until a token is available; return the seconds spent waiting."""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return now - start
+                shortfall = (1 - self._tokens) / self.rate
+            time.sleep(shortfall)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_MESSAGES = ("429", "rate limit", "resource exhausted", "resourceexhausted", "quota", "unavailable", "deadline exceeded")
+
+def is_retryable_error(error: Exception) -> bool:
+    """Return True for rate-limit and transient upstream errors worth retrying."""
+    for status in (
+        getattr(error, "status_code", None),
+        getattr(error, "code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(status, int) and status in RETRYABLE_STATUS_CODES:
+            return True
+    message = f"{type(error).__name__} {error}".lower()
+    return any(marker in message for marker in RETRYABLE_MESSAGES)
+
+class LLMGovernor:
+    """
+    Governs upstream LLM calls: token-bucket rate limiting, exponential backoff with
+    full jitter for retryable errors, and single-flight coalescing so identical
+    concurrent prompts share one upstream call.
+    """
+
+    def __init__(self, rate_per_sec: float = 1.0, burst: int = 5, max_retries: int = 4,
+                 base_delay: float = 1.0, max_delay: float = 30.0):
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            'requests': 0,
+            'upstream_calls': 0,
+            'coalesced': 0,
+            'retries': 0,
+            'failures': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'prompt_tokens': 0,
+            'response_tokens': 0,
+        }
+
+    def _record(self, **increments) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                if name == 'queue_wait_max':
+                    self._metrics[name] = max(self._metrics[name], value)
+                else:
+                    self._metrics[name] += value
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run `fn` under the governor; concurrent calls with the same key share one result."""
+        self._record(requests=1)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            self._record(coalesced=1)
+            return future.result()
+
+        try:
+            result = self._call_with_retries(fn)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            self._record(failures=1)
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _call_with_retries(self, fn: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            self._record(upstream_calls=1, queue_wait_total=waited, queue_wait_max=waited)
+            try:
+                return fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                self._record(retries=1)
+                time.sleep(self.backoff_delay(attempt))
+                attempt += 1
+
+    def record_tokens(self, prompt_tokens: int, response_tokens: int) -> None:
+        self._record(prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of request, retry and queue-wait counters."""
+        with self._lock:
+            snapshot = dict(self._metrics)
+        waited_calls = snapshot['upstream_calls']
+        snapshot['queue_wait_avg'] = snapshot['queue_wait_total'] / waited_calls if waited_calls else 0.0
+        return snapshot
+
+_governor: Optional[LLMGovernor] = None
+_governor_lock = threading.Lock()
+
+def get_governor() -> LLMGovernor:
+    """Return the process-wide governor, configured from LLM_* environment variables."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _load_env()
+            _governor = LLMGovernor(
+                rate_per_sec=float(os.environ.get("LLM_RATE_PER_SEC", "1.0")),
+                burst=int(os.environ.get("LLM_BURST", "5")),
+                max_retries=int(os.environ.get("LLM_MAX_RETRIES", "4")),
+                base_delay=float(os.environ.get("LLM_BACKOFF_BASE", "1.0")),
+                max_delay=float(os.environ.get("LLM_BACKOFF_MAX", "30.0")),
+            )
+        return _governor
+
+def run_gemini_query(query_type: str, query: str, columns: Union[list, str],
+                     usage: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Send prompt to Gemini LLM (through the request governor) and return pandas code string.
+    usage: optional dict filled with prompt/response token counts and latency for this request
+    """
     llm = get_gemini_llm()
     prompt = get_prompt(query_type, query, columns)
+    governor = get_governor()
+    start = time.perf_counter()
     try:
-        response = llm(prompt)
-        code = parse_llm_response(response)
-        return code
+        response = governor.call(prompt, lambda: llm(prompt))
     except Exception as e:
         print(f"Error calling Gemini LLM: {e}")
+        response = None
+
+    prompt_tokens = estimate_tokens(prompt)
+    response_tokens = estimate_tokens(response) if response else 0
+    governor.record_tokens(prompt_tokens, response_tokens)
+    if usage is not None:
+        usage.update(prompt_tokens=prompt_tokens, response_tokens=response_tokens,
+                     latency=time.perf_counter() - start)
+    if response is None:
         return None
+    return parse_llm_response(response)
@@ -0,0 +1,252 @@
+"""
+Lazy multi-step query plans over excel_tools operations.
+
+A plan is an immutable chain of steps (filter -> aggregate -> sort -> pivot, or a raw
+pandas expression from the LLM). Nothing runs until `execute_plan`, which fuses adjacent
+steps where possible and caches intermediate results by plan hash, so refinements
+("now only North region") start from the cached parent result instead of the full sheet.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+import excel_tools
+from aggregate_index import MONTH_SUFFIX
+
+PLAN_OPS = ('filter', 'aggregate', 'sort', 'pivot', 'last_activity', 'expr')
+
+@dataclass(frozen=True)
+class PlanStep:
+    op: str
+    params: Tuple[Tuple[str, Any], ...]
+
+    @property
+    def kwargs(self) -> Dict[str, Any]:
+        return {name: _thaw(value) for name, value in self.params}
+
+def _freeze(value: Any) -> Any:
+    """Make step parameters hashable; dict order is kept since it sets output column order."""
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, tuple):
+        if value and all(isinstance(v, tuple) and len(v) == 2 and isinstance(v[0], str) for v in value):
+            return {k: _thaw(v) for k, v in value}
+        return [_thaw(v) for v in value]
+    return value
+
+class QueryPlan:
+    """Immutable, lazily evaluated chain of operations on one source sheet."""
+
+    def __init__(self, source: str, steps: Tuple[PlanStep, ...] = ()):
+        self.source = source
+        self.steps = tuple(steps)
+
+    def _then(self, op: str, **params) -> 'QueryPlan':
+        step = PlanStep(op, tuple((name, _freeze(value)) for name, value in params.items()))
+        return QueryPlan(self.source, self.steps + (step,))
+
+    def filter(self, conditions: str) -> 'QueryPlan':
+        return self._then('filter', conditions=conditions)
+
+    def aggregate(self, group_by: List[str], metrics: Dict[str, str]) -> 'QueryPlan':
+        return self._then('aggregate', group_by=group_by, metrics=metrics)
+
+    def sort(self, by: List[str], ascending: Optional[List[bool]] = None) -> 'QueryPlan':
+        return self._then('sort', by=by, ascending=ascending)
+
+    def pivot(self, index: List[str], columns: List[str], values: List[str], aggfunc: str = 'sum') -> 'QueryPlan':
+        return self._then('pivot', index=index, columns=columns, values=values, aggfunc=aggfunc)
+
+    def last_activity(self, key: str, date_column: str, inactive_since: Optional[str] = None) -> 'QueryPlan':
+        return self._then('last_activity', key=key, date_column=date_column, inactive_since=inactive_since)
+
+    def expr(self, code: str) -> 'QueryPlan':
+        """Append a pandas expression over `df` (e.g. LLM-generated code)."""
+        return self._then('expr', code=code)
+
+    @classmethod
+    def from_steps(cls, source: str, steps: List[Dict[str, Any]]) -> 'QueryPlan':
+        """Build a plan from dicts like {'op': 'filter', 'conditions': "Region == 'North'"}."""
+        plan = cls(source)
+        for step in steps:
+            params = dict(step)
+            op = params.pop('op', None)
+            if op not in PLAN_OPS:
+                raise ValueError(f"Unknown plan operation: {op}")
+            plan = getattr(plan, op)(**params)
+        return plan
+
+    def prefix(self, length: int) -> 'QueryPlan':
+        return QueryPlan(self.source, self.steps[:length])
+
+    @property
+    def parent(self) -> Optional['QueryPlan']:
+        return self.prefix(len(self.steps) - 1) if self.steps else None
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha1(repr((self.source, self.steps)).encode()).hexdigest()
+
+    def describe(self) -> str:
+        parts = [f"{step.op}({', '.join(f'{k}={v!r}' for k, v in step.kwargs.items())})" for step in self.steps]
+        return " -> ".join([self.source] + parts)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __repr__(self) -> str:
+        return f"QueryPlan({self.describe()})"
+
+class PlanCache:
+    """Thread-safe LRU cache of intermediate plan results, keyed by plan hash (one per session)."""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, pd.DataFrame]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def longest_prefix(self, plan: QueryPlan) -> Tuple[int, Optional[pd.DataFrame]]:
+        """Return (length, result) for the longest cached prefix of `plan`, or (0, None)."""
+        with self._lock:
+            for length in range(len(plan), 0, -1):
+                key = plan.prefix(length).key
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return length, self._entries[key]
+            self.misses += 1
+            return 0, None
+
+    def put(self, key: str, result: pd.DataFrame) -> None:
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+def fuse_steps(steps: Tuple[PlanStep, ...]) -> List[Tuple[PlanStep, ...]]:
+    """
+    Group steps into fused stages:
+    - consecutive filters become one query (one pass over the frame)
+    - a filter followed by aggregate/pivot evaluates the mask and groups only the needed
+      columns, without materializing the full filtered frame
+    """
+    stages: List[Tuple[PlanStep, ...]] = []
+    for step in steps:
+        last = stages[-1] if stages else None
+        if last and step.op == 'filter' and all(s.op == 'filter' for s in last):
+            stages[-1] = last + (step,)
+        elif last and step.op in ('aggregate', 'pivot') and all(s.op == 'filter' for s in last):
+            stages[-1] = last + (step,)
+        else:
+            stages.append((step,))
+    return stages
+
+def _combined_conditions(filters: Tuple[PlanStep, ...]) -> str:
+    conditions = [step.kwargs['conditions'] for step in filters]
+    if len(conditions) == 1:
+        return conditions[0]
+    return " and ".join(f"({c})" for c in conditions)
+
+def _run_expr(df: pd.DataFrame, code: str) -> pd.DataFrame:
+    local_vars = {'df': df.copy()}
+    try:
+        exec(f"result = {code}", {}, local_vars)
+    except Exception as e:
+        raise RuntimeError(f"Failed to evaluate expression: {e}")
+    result = local_vars['result']
+    if isinstance(result, pd.Series):
+        result = result.to_frame()
+    return result
+
+def _run_stage(stage: Tuple[PlanStep, ...], df: pd.DataFrame, agg_index=None, date_index=None) -> pd.DataFrame:
+    head, *_ = stage
+    tail = stage[-1]
+    if head.op == 'filter' and tail.op in ('aggregate', 'pivot'):
+        params = tail.kwargs
+        if tail.op == 'aggregate':
+            needed = list(params['group_by']) + list(params['metrics'])
+        else:
+            needed = list(params['index']) + list(params['columns']) + list(params['values'])
+        # Derived month dimensions (Date_month) are projected through their date column
+        columns = list(dict.fromkeys(
+            name[:-len(MONTH_SUFFIX)] if name not in df.columns and str(name).endswith(MONTH_SUFFIX) else name
+            for name in needed
+        ))
+        conditions = _combined_conditions(stage[:-1])
+        filtered = date_index.filter(df, conditions) if date_index is not None and date_index.covers(df) else None
+        if filtered is not None:
+            projected = filtered[columns]
+        else:
+            try:
+                mask = df.eval(conditions)
+            except Exception as e:
+                raise RuntimeError(f"Failed to filter data: {e}")
+            projected = df.loc[mask, columns]
+        if tail.op == 'aggregate':
+            return excel_tools.aggregate_data(projected, **params)
+        return excel_tools.pivot_table(projected, **params)
+    if head.op == 'filter':
+        return excel_tools.filter_data(df, _combined_conditions(stage), date_index=date_index)
+    if head.op == 'aggregate':
+        return excel_tools.aggregate_data(df, **head.kwargs, agg_index=agg_index)
+    if head.op == 'sort':
+        return excel_tools.sort_data(df, **head.kwargs)
+    if head.op == 'pivot':
+        return excel_tools.pivot_table(df, **head.kwargs, agg_index=agg_index)
+    if head.op == 'last_activity':
+        return excel_tools.last_activity(df, **head.kwargs, date_index=date_index)
+    if head.op == 'expr':
+        return _run_expr(df, head.kwargs['code'])
+    raise ValueError(f"Unknown plan operation: {head.op}")
+
+def execute_plan(plan: QueryPlan, df: pd.DataFrame, cache: Optional[PlanCache] = None,
+                 agg_index=None, date_index=None) -> pd.DataFrame:
+    """
+    Evaluate `plan` against the source frame `df`, resuming from the longest cached
+    prefix and caching the result after every fused stage. `agg_index` (an
+    AggregateIndex over `df`) answers aggregate/pivot steps applied directly to the sheet;
+    `date_index` (a DateIndex over `df`) turns date-range filters on the sheet into slices
+    and answers last_activity steps from its precomputed per-key dates.
+    """
+    start, current = 0, df
+    if cache is not None:
+        start, cached = cache.longest_prefix(plan)
+        if cached is not None:
+            current = cached
+
+    position = start
+    for stage in fuse_steps(plan.steps[start:]):
+        current = _run_stage(stage, current, agg_index, date_index)
+        position += len(stage)
+        if cache is not None:
+            cache.put(plan.prefix(position).key, current)
+    return current
@@ -0,0 +1,85 @@
+"""
+Schema context for LLM prompts: compact per-column summaries, ranked by relevance to the
+query and trimmed to a token budget so wide sheets don't bloat prompts.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import pandas as pd
+from column_mapping import rank_columns_by_relevance
+from llm_utils import _load_env, estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 800  # Overridden by SCHEMA_TOKEN_BUDGET (environment or .env)
+MAX_CATEGORICAL_UNIQUE = 20  # Columns with at most this many distinct values list them
+MAX_SAMPLE_VALUES = 5
+
+@dataclass
+class SchemaContext:
+    """Rendered schema text plus bookkeeping for cost/latency tracking."""
+    text: str
+    columns: List[str]
+    omitted: List[str] = field(default_factory=list)
+    token_count: int = 0
+
+def summarize_column(series: pd.Series) -> str:
+    """One compact line per column: name, dtype and a few values or the value range."""
+    name = str(series.name)
+    dtype = str(series.dtype)
+    values = series.dropna()
+    if values.empty:
+        return f"{name} ({dtype}, empty)"
+    if pd.api.types.is_bool_dtype(series) or not (
+        pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)
+    ):
+        distinct = values.unique()
+        shown = ", ".join(str(v) for v in distinct[:MAX_SAMPLE_VALUES])
+        if len(distinct) <= MAX_CATEGORICAL_UNIQUE:
+            more = ", ..." if len(distinct) > MAX_SAMPLE_VALUES else ""
+            return f"{name} ({dtype}, {len(distinct)} values: {shown}{more})"
+        return f"{name} ({dtype}, e.g. {shown})"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return f"{name} ({dtype}, {values.min():%Y-%m-%d}..{values.max():%Y-%m-%d})"
+    return f"{name} ({dtype}, {values.min()}..{values.max()})"
+
+def summarize_schema(df: pd.DataFrame) -> Dict[str, str]:
+    """Summaries for every column; query-independent, so callers can cache it per sheet."""
+    return {column: summarize_column(df[column]) for column in df.columns}
+
+def build_schema_context(df: pd.DataFrame, query: str, token_budget: Optional[int] = None,
+                         summaries: Optional[Dict[str, str]] = None) -> SchemaContext:
+    """
+    Build the `{columns}` prompt context: most relevant columns first, stopping at the token
+    budget. Omitted columns are listed by name only while the budget allows.
+    """
+    if token_budget is None:
+        # Read per call: .env is loaded lazily, after this module is imported
+        _load_env()
+        token_budget = int(os.environ.get("SCHEMA_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+    if summaries is None:
+        summaries = summarize_schema(df)
+
+    ranked = [column for column, _ in rank_columns_by_relevance(query, list(df.columns))]
+    lines: List[str] = []
+    used = 0
+    included: List[str] = []
+    omitted: List[str] = []
+    for column in ranked:
+        line = summaries.get(column) or summarize_column(df[column])
+        cost = estimate_tokens(line + "; ")
+        # Always keep the best match even if it alone exceeds the budget
+        if included and used + cost > token_budget:
+            omitted.append(column)
+            continue
+        lines.append(line)
+        included.append(column)
+        used += cost
+
+    text = "; ".join(lines)
+    if omitted:
+        names = ", ".join(str(c) for c in omitted)
+        tail = f"; other columns: {names}"
+        if used + estimate_tokens(tail) > token_budget:
+            tail = f"; {len(omitted)} other columns omitted"
+        text += tail
+
+    return SchemaContext(text=text, columns=included, omitted=omitted, token_count=estimate_tokens(text))
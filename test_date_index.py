@@ -0,0 +1,39 @@
+"""
+Regression tests: DateIndex.filter must return the same rows as df.query, including
+dates and bounds outside the datetime64[ns] range (1677-2262).
+"""
+import pandas as pd
+import pytest
+from date_index import DateIndex
+
+def _sheet(unit: str) -> pd.DataFrame:
+    return pd.DataFrame({
+        'Date': pd.to_datetime(['2023-06-01', '2024-01-15', '2024-05-05', '2024-09-30']).as_unit(unit),
+        'Total_Amount': [100.0, 250.0, 75.0, 300.0],
+    })
+
+def _assert_matches_query(df: pd.DataFrame, conditions: str) -> None:
+    result = DateIndex.build(df).filter(df, conditions)
+    expected = df.query(conditions)
+    if result is not None:
+        pd.testing.assert_frame_equal(result, expected)
+
+def test_sentinel_date_beyond_ns_range():
+    # read_excel returns datetime64[us] with pandas 3; 9999-12-31 is a common "open ended" sentinel
+    df = pd.DataFrame({
+        'Start': pd.to_datetime(['2023-01-01', '2023-06-01', '2024-01-01', '2024-02-01']).as_unit('us'),
+        'End': pd.to_datetime(['2023-12-31', '2024-02-01', '2024-06-30', '9999-12-31']).as_unit('us'),
+    })
+    conditions = "End > '2024-03-01'"
+    assert list(DateIndex.build(df).filter(df, conditions).index) == [2, 3]
+    _assert_matches_query(df, conditions)
+
+@pytest.mark.parametrize('unit', ['s', 'us', 'ns'])
+@pytest.mark.parametrize('conditions', [
+    "Date > '1500-01-01'",
+    "Date < '2300-01-01'",
+    "Date >= '1500-01-01' and Date < '2300-01-01'",
+    "Date >= '2024-01-01' and Total_Amount > 80",
+])
+def test_bounds_outside_ns_range(unit, conditions):
+    _assert_matches_query(_sheet(unit), conditions)